@@ -72,10 +72,10 @@ def _detect_dialect(path: Path, encoding: str) -> csv.Dialect:
         quoting = csv.QUOTE_MINIMAL
     return _SingleCol
 
-def load_csv(path: Path, has_header: bool = True) -> Tuple[List[str], List[List[str]]]:
+def read_rows(path: Path) -> Tuple[List[List[str]], str]:
     """
-    CSV 全体を読み込み、ヘッダ(List[str]) と 行データ(List[List[str]]) を返す。
-    has_header=False なら1行目をデータとして扱う。
+    ファイル全体を行データとして読み込み、(行データ, 推定した区切り文字) を返す。
+    区切りを推定できなかったファイル（UKE など）は単一列扱いで、区切り文字は "\x1f" になる。
     """
     enc = _detect_encoding(path)
     dialect = _detect_dialect(path, enc)
@@ -83,6 +83,14 @@ def load_csv(path: Path, has_header: bool = True) -> Tuple[List[str], List[List[
     with path.open("r", encoding=enc, newline="") as f:
         reader = csv.reader(f, dialect)
         rows = list(reader)
+    return rows, dialect.delimiter
+
+def load_csv(path: Path, has_header: bool = True) -> Tuple[List[str], List[List[str]]]:
+    """
+    CSV 全体を読み込み、ヘッダ(List[str]) と 行データ(List[List[str]]) を返す。
+    has_header=False なら1行目をデータとして扱う。
+    """
+    rows, _ = read_rows(path)
 
     if not rows:
         return [], []
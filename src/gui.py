@@ -1,21 +1,60 @@
 # src/gui.py
-import datetime, re, tkinter as tk
+import datetime, functools, io, itertools, os, queue, re, threading, tkinter as tk
+from contextlib import contextmanager
 from tkinter import filedialog, messagebox, simpledialog, ttk
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Sequence
 import json
 import csv
 
+import numpy as np
+
 import branch_manager as bm
 import highlighter
-from editor import load_csv
-import converter
+from editor import read_rows
+from converter import RE_FIELD
 import reconcile_patient_codes as rpc
 
 DISPLAY_COL = 0   # フィルタ用列（先頭列）
 MAX_TRAILING_COMMAS = 30
+VIEW_ROWS = 2000  # Text に一度に入れる最大行数（超える分はスクロールに合わせて入れ替える）
+CLIP_MARGIN = 200  # ハイライトは画面に見えている行の前後この行数まで塗る
 APP_VERSION = "v2.1.1"
 
+# UKE ファイル名（呼び出しごとに compile しない。行内の RE フィールドは converter.RE_FIELD）
+_UKE_NAME_RE = re.compile(r"^(.*?)(\.UKE)(.*)$", re.IGNORECASE)
+# フィールド内の改行の表示用記号（1 文字ずつ置き換えるので桁はずれず、1 行が Text の 1 行に収まる）
+_NEWLINE_GLYPHS = str.maketrans({"\r": "␍", "\n": "␊"})
+
+
+def _may_have_re(line: str) -> bool:
+    """RE フィールドを含み得るか（大小文字問わず "RE" の部分文字列があるか）を正規表現より先に安く判定"""
+    return "RE" in line or "re" in line or "Re" in line or "rE" in line
+
+
+@functools.lru_cache(maxsize=4096)
+def _normalize(code: str, n: int) -> str:
+    """code を n 桁へ（長い → 左からカット / 短い・同じ → 左 0 埋め）。同じ患者コードは何度も出るので結果を覚えておく"""
+    if len(code) > n:
+        return code[-n:]
+    return code.zfill(n)
+
+
+def _re_field_end(line: str) -> int:
+    """先頭の RE フィールドの終端位置（無ければ -1）。RE_FIELD.search(line).end() と同じ値を返す。
+
+    RE レコードは行頭が "RE," なので、その形だけ str.startswith で即決し、
+    それ以外（小文字・空白・途中の RE など）は正規表現に回す。
+    """
+    if line.startswith("RE,"):
+        return 3
+    if line.startswith('"RE",'):
+        return 5
+    if not _may_have_re(line):
+        return -1
+    m = RE_FIELD.search(line)
+    return m.end() if m else -1
+
 class UKEEditorGUI(tk.Tk):
     # ────────────────────────── 初期化 ──────────────────────────
     def __init__(self) -> None:
@@ -28,7 +67,32 @@ class UKEEditorGUI(tk.Tk):
         # === データ ===
         self.file_path: Optional[Path] = None
         self.rows: List[List[str]] = []
-        self.display_indices: List[int] = []
+        # 表示中の行番号（昇順）。全行なら range、絞り込み中は _prefix_index の list をそのまま指す
+        #   どちらも書き換えず、差し替えるだけにする（ワーカーへはコピーせずに渡す）
+        self.display_indices: Sequence[int] = []
+        # 表示順 → 論理行番号（int）。常に 1 始まりの連番なので range で持つ（_build_text で更新）
+        #   フィールド内の改行は表示時に記号へ置き換えるので、1 行は必ず Text の 1 行になる
+        self.line_starts: range = range(1, 1)
+        # 行の結合文字列キャッシュ（表示用 "|" 区切り / 変換・走査用 "," 区切り）
+        #   "|" 区切りは表示窓に入った行の分だけ作る（未作成は None）
+        self._row_pipe: List[Optional[str]] = []
+        self._row_csv: List[str] = []
+        self._re_end: List[int] = []   # 各行の先頭 RE フィールド終端（無ければ -1）
+        # 先頭列だけを列として切り出して保持（行ごとの list をたどらずに済むように）
+        self._col0: List[str] = []
+        # 先頭列の先頭2文字だけを連続配列で保持（フィルタ／コード一覧用）
+        self._col0_prefix = np.empty(0, dtype="U2")
+        self._prefix_index: dict[str, List[int]] = {}    # 先頭2文字 → 行番号リスト
+        self._filter_code: str | None = None             # 表示中の絞り込みコード（None = 全行）
+        self._requote_rows: List[int] = []                # 保存時に csv.writer で組み直す行
+        self._delimiter = ","                             # 読み込み時に推定した区切り文字
+        # Text に入れている表示窓（display_indices 上の先頭位置）
+        self._view_start = 0
+        self._view_shift_pending = False
+        self._clip_job = None          # 画面付近の塗り直し（after の予約 ID）
+        self._filter_job = None        # 一覧の選択変更による絞り込み（after の予約 ID）
+        self._yview = (0.0, 1.0)       # yscrollcommand で届いた直近の表示位置（割合）
+        self._window_len = 0           # Text に入れている行数
 
         # === GUI 部品 === -------------------------------------------------
         self._build_toolbar()
@@ -47,13 +111,29 @@ class UKEEditorGUI(tk.Tk):
         self.hl = highlighter.Highlighter(self.row_text)
         self.hl.detect_mode_current = self.detect_mode.get()
         self.highlight_pat = None
+        # バックグラウンド走査の結果受け取り（job 番号が古い結果は捨てる）
+        self._hl_queue: "queue.Queue[tuple[int, object]]" = queue.Queue()
+        self._hl_job = 0
+        self._hl_waiting = False
+        self._hl_pending = None   # 待っている走査の (パターン, 走査条件, focus)
+        # バックグラウンド読み込みの結果受け取り（後から別ファイルを選んだら古い結果は捨てる）
+        self._load_queue: "queue.Queue[tuple[int, Path, object]]" = queue.Queue()
+        self._load_job = 0
+        # 直近の走査条件（同じなら再走査せず描画だけやり直す）
+        self._view_version = 0
+        self._last_scan_key = None
+        self._status_pending = False
+        self._status_parts: list[str] = []   # 直近の集計表示（窓が動いたら窓位置だけ差し替えて出し直す）
+        self._status_is_counts = False       # いまのステータスが集計表示か（明示メッセージなら False）
+        self.hl.on_reveal = self._reveal_line
         
         # 前回サイズを復元・終了時に保存
         self._restore_geometry()
         self.protocol("WM_DELETE_WINDOW", self._save_geometry_and_quit)        
         
-        # 初回ロード
-        _ = bm.list_suffixes(1); _ = bm.list_suffixes(2)
+        # 初回ロード（照合用に集合で持つ。登録時・保存開始時に読み直す）
+        self._suffix_sets: dict[int, frozenset[str]] = {}
+        self._reload_suffix_sets()
         self.bind_all("<Control-b>", lambda e: self.register_branches())
         
         # 枝番表示パネル
@@ -117,12 +197,16 @@ class UKEEditorGUI(tk.Tk):
         # 左: 2桁コードのリスト
         self.row_lb = tk.Listbox(list_frame, width=6)
         self.row_lb.pack(side=tk.LEFT, fill=tk.Y, padx=(10, 0))
-        self.row_lb.bind("<<ListboxSelect>>", self.filter_by_code)
+        self.row_lb.bind("<<ListboxSelect>>", self._schedule_filter)
         tk.Label(list_frame, text="コード").pack(side=tk.LEFT, anchor=tk.NW)
 
-        # 右: 行内容
-        self.row_text = tk.Text(list_frame, wrap="none", width=120, height=25)
+        # 右: 行内容（スクロールバーは Text の窓ではなく表示行全体に対する位置を示す）
+        self.row_vsb = ttk.Scrollbar(list_frame, orient="vertical", command=self._on_vsb)
+        self.row_vsb.pack(side=tk.RIGHT, fill=tk.Y)
+        self.row_text = tk.Text(list_frame, wrap="none", width=120, height=25,
+                                yscrollcommand=self._on_text_yscroll)
         self.row_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.row_text.bind("<Configure>", lambda _e: self._schedule_viewport_redraw())
         self._insert_help_text()
 
         # 下: 変換して保存
@@ -141,15 +225,73 @@ class UKEEditorGUI(tk.Tk):
             filetypes=[("UKE/CSV", "*.UKE *.uke *.csv"), ("すべて", "*")])
         if not path:
             return
+        # 文字コード判定・CSV 解析はワーカースレッドで行い、UI は応答可能なまま待つ
+        self._load_job += 1
+        job = self._load_job
+        threading.Thread(target=self._load_worker, args=(job, Path(path)), daemon=True).start()
+        self._set_status(f"読み込み中…: {Path(path).name}")
+        self.after(30, self._drain_load)
+
+    def _load_worker(self, job: int, path: Path):
+        """別スレッド：Tk には触らず読み込みだけしてキューへ渡す"""
+        try:
+            result: object = read_rows(path)   # (行データ, 区切り文字)
+        except Exception as e:
+            result = e
+        self._load_queue.put((job, path, result))
+
+    def _drain_load(self):
+        """メインスレッド：最新 job の読み込み結果だけを反映する"""
         try:
-            self.file_path = Path(path)
-            _, self.rows = load_csv(self.file_path, has_header=False)
-            self.display_indices = list(range(len(self.rows)))
+            job, path, result = self._load_queue.get_nowait()
+        except queue.Empty:
+            self.after(30, self._drain_load)
+            return
+        if job != self._load_job:
+            return   # 読み込み中に別ファイルが選ばれた（そちらの _drain_load が受け取る）
+        if isinstance(result, Exception):
+            messagebox.showerror("読み込み失敗", str(result))
+            return
+        try:
+            self.file_path = path
+            self.rows, self._delimiter = result
+            self._cache_row_strings()
+            self.display_indices = range(len(self.rows))
+            self._filter_code = None
             self._refresh_lists_and_text()
-            self.status.set(f"読み込み完了: {self.file_path.name}")
+            self._set_status(f"読み込み完了: {self.file_path.name}")
         except Exception as e:
             messagebox.showerror("読み込み失敗", str(e))
 
+    def _cache_row_strings(self):
+        """行の結合文字列・先頭列配列を一度だけ作っておく（self.rows を書き換えたら再実行すること）"""
+        self._row_pipe = [None] * len(self.rows)
+        self._row_csv = [",".join(r) for r in self.rows]
+        # 行の長さはレコード種別ごとに異なるので全列の転置はせず、参照の多い先頭列だけを列で持つ
+        self._col0 = [r[DISPLAY_COL] if DISPLAY_COL < len(r) else "" for r in self.rows]
+        # レコード種別（先頭列）が "RE" で後続列がある行は判定不要。それ以外だけ _re_field_end で確かめる
+        self._re_end = [
+            3 if (c == "RE" and len(line) > 2) else _re_field_end(line)
+            for c, line in zip(self._col0, self._row_csv)
+        ]
+        self._col0_prefix = np.array(self._col0, dtype="U2")   # U2 への変換で先頭2文字に切り詰まる
+        # コード一覧のクリックを辞書引き 1 回で済ませるための索引（行番号は昇順）
+        idx_map: dict[str, List[int]] = {}
+        for i, code in enumerate(self._col0_prefix.tolist()):
+            idx_map.setdefault(code, []).append(i)
+        self._prefix_index = idx_map
+        # "," 結合だと列がずれる行（フィールド内にカンマ・改行）は保存時に組み直すので、位置だけ控えておく
+        #   カンマ区切りとして読めたファイルだけが対象。区切りを推定できなかった UKE は単一列扱いで
+        #   行 = [生の 1 行] なので、"," 結合がそのまま元の行になる（組み直すと全体が引用符で囲まれてしまう）
+        rows = self.rows
+        if self._delimiter != ",":
+            self._requote_rows = []
+        else:
+            self._requote_rows = [
+                i for i, line in enumerate(self._row_csv)
+                if line.count(",") != max(len(rows[i]) - 1, 0) or "\n" in line or "\r" in line
+            ]
+
     # ────────────────────────── 表示系ユーティリティ ──────────────────────────
     def _refresh_lists_and_text(self):
         self._build_left_codes()
@@ -157,73 +299,193 @@ class UKEEditorGUI(tk.Tk):
 
     def _build_left_codes(self):
         self.row_lb.delete(0, tk.END)
-        seen = set()
-        for idx in self.display_indices:
-            code = self.rows[idx][DISPLAY_COL][:2] if DISPLAY_COL < len(self.rows[idx]) else ""
-            if code not in seen:
-                self.row_lb.insert(tk.END, code); seen.add(code)
+        # 一覧は読み込み時（全行表示）にだけ作るので、索引のキーがそのまま出現順のコード一覧
+        codes = list(self._prefix_index)
+        # Listbox へは 1 回で挿入
+        if codes:
+            self.row_lb.insert(tk.END, *codes)
 
     def _build_text(self):
-        self.row_text.config(state="normal")
-        self.row_text.delete("1.0", "end")
-        self.line_starts = []
-
-        for idx in self.display_indices:
-            self.line_starts.append(self.row_text.index(tk.INSERT))
-            self.row_text.insert(tk.END, "|".join(self.rows[idx]) + "\n")
-
-        self.row_text.config(state="disabled")
+        # 論理行番号（表示順 1 始まり）。ハイライト座標はこの番号で持ち、描画時に表示窓へ写す
+        self.line_starts = range(1, len(self.display_indices) + 1)
+        self._render_window(0)
+        self._view_version += 1            # 表示内容が変わったので走査結果は無効
 
         # ★ここで表示行数を更新し、ハイライト再描画後に status 表示へ使う
         # 表示行数を保存 → ハイライト再描画
         self.visible_count = len(self.display_indices)
-        self._apply_highlight()            # ←従来どおり
 
-        # ★ここでステータスバーを更新
-        self._update_status_counts()
-
-    def _count_branch_hits(self) -> tuple[int, int, int]:
-        """
-        表示中の行(self.display_indices)を RE 以降だけ self.hl.regex で再スキャンして、
-        枝番のヒット数を数える（ハイライト結果オブジェクトに依存しない）
-        戻り値: (total, one_digit_hits, two_digit_hits)
-        """
-        if not self.hl.regex:
-            return 0, 0, 0
-
-        pat = self.hl.regex
-        RE_FIELD = re.compile(r'(^|,)\s*"?RE"?\s*(,|$)', re.IGNORECASE)
+        # ★ステータスバーはアイドル時にまとめて更新（走査を待つ間は「計算中」が優先）
+        self._schedule_status()
+        self._apply_highlight()            # ←従来どおり
 
-        ones = set(bm.list_suffixes(1))
-        twos = set(bm.list_suffixes(2))
-        
-        L = self.patient_code_len; mode = self.br_mode.get()
-        ones = set(bm.list_suffixes(1)); twos = set(bm.list_suffixes(2))
+    @contextmanager
+    def _editable(self):
+        """本文を書き換える間だけ Text を normal にする（タグ操作だけなら不要）"""
+        self.row_text.config(state="normal")
+        try:
+            yield
+        finally:
+            self.row_text.config(state="disabled")
+
+    # --- 表示窓（行数が多いときは VIEW_ROWS 行ぶんだけ Text に入れる） ---
+    def _clamp_view_start(self, start: int) -> int:
+        n = len(self.display_indices)
+        return max(0, min(start, n - VIEW_ROWS)) if n > VIEW_ROWS else 0
+
+    def _render_window(self, start: int) -> None:
+        """display_indices[start:start+VIEW_ROWS] だけを Text に入れ直す（タグは呼び出し側で描き直す）"""
+        start = self._clamp_view_start(start)
+        rows = self.display_indices[start:start + VIEW_ROWS]
+        self._view_start = start
+        self._window_len = len(rows)
+        self.hl.set_view(start, len(rows) if len(self.display_indices) > VIEW_ROWS else None)
+
+        # 入れ替え途中の yscrollcommand（先頭に戻った位置が届く）では窓を動かさない
+        self._view_shift_pending = True
+        with self._editable():
+            self.row_text.delete("1.0", "end")
+            # 1 行ずつ insert すると都度レイアウトが走るため、全体を 1 本の文字列にして 1 回で挿入
+            if rows:
+                self.row_text.insert("1.0", "\n".join(self._pipe_lines(rows)) + "\n")
+        self.row_text.update_idletasks()   # レイアウトはここで 1 回だけ
+        self._view_shift_pending = False
+        if self._status_is_counts:
+            self._show_status_counts()     # 窓位置の表示だけ更新（再集計はしない）
+
+    def _pipe_lines(self, rows: List[int]) -> List[str]:
+        """rows の "|" 結合文字列。初めて表示する行だけ結合してキャッシュに残す（改行は記号にする）"""
+        pipe, src = self._row_pipe, self.rows
+        out = []
+        for i in rows:
+            line = pipe[i]
+            if line is None:
+                line = "|".join(src[i])
+                if "\n" in line or "\r" in line:
+                    line = line.translate(_NEWLINE_GLYPHS)
+                pipe[i] = line
+            out.append(line)
+        return out
+
+    def _on_text_yscroll(self, first: str, last: str) -> None:
+        """窓の端に近づいたら、アイドル時に表示窓をずらす（スクロール中に Text を作り直さない）"""
+        self._yview = (float(first), float(last))
+        self.row_vsb.set(*self._to_global_fraction(*self._yview))
+        self._schedule_viewport_redraw()
+        if self._view_shift_pending or len(self.display_indices) <= VIEW_ROWS:
+            return
+        if self._near_window_edge(*self._yview):
+            self._view_shift_pending = True
+            self.after_idle(self._shift_window)
+
+    def _to_global_fraction(self, first: float, last: float) -> tuple[float, float]:
+        """Text（窓）内の表示割合 → 表示行全体に対する割合"""
+        n = len(self.display_indices)
+        if n <= VIEW_ROWS:
+            return first, last
+        total = self._window_len + 1       # 末尾の空行ぶん
+        return ((self._view_start + first * total) / n, min(1.0, (self._view_start + last * total) / n))
+
+    def _on_vsb(self, *args) -> None:
+        """スクロールバー操作。つまみのドラッグは表示行全体の位置として扱い、必要なら窓を移す"""
+        n = len(self.display_indices)
+        if args[0] != "moveto" or n <= VIEW_ROWS:
+            self.row_text.yview(*args)   # 行・ページ単位のスクロールは窓端の入れ替えに任せる
+            return
+        k = max(0, min(n - 1, int(float(args[1]) * n)))   # 先頭に来るべき表示順 0 始まりの行
+        moved = not (self._view_start <= k < self._view_start + VIEW_ROWS)
+        if moved:
+            self._render_window(k - VIEW_ROWS // 2)
+        self.row_text.yview(f"{k - self._view_start + 1}.0")
+        if moved and self.hl.regex:
+            self._redraw_only(reveal=False)
+
+    def _near_window_edge(self, first: float, last: float) -> bool:
+        return ((first <= 0.1 and self._view_start > 0) or
+                (last >= 0.9 and self._view_start + VIEW_ROWS < len(self.display_indices)))
+
+    def _shift_window(self) -> None:
+        """画面最上行を保ったまま、その行が窓の中央付近に来るよう入れ替える"""
+        self._view_shift_pending = False
+        if not self._near_window_edge(*self.row_text.yview()):
+            return
+        top = self._view_start + int(self.row_text.index("@0,0").split(".")[0]) - 1
+        start = self._clamp_view_start(top - VIEW_ROWS // 2)
+        if start == self._view_start:
+            return
+        self._render_window(start)
+        self.row_text.yview(f"{top - start + 1}.0")
+        if self.hl.regex:
+            self._redraw_only(reveal=False)
+
+    # --- 画面付近だけのハイライト ---
+    def _visible_lines(self) -> tuple[int, int]:
+        """画面に見えている論理行の範囲（1 始まり・両端含む）"""
+        top = int(self.row_text.index("@0,0").split(".")[0])
+        bottom = int(self.row_text.index(f"@0,{self.row_text.winfo_height()}").split(".")[0])
+        return self._view_start + top, self._view_start + bottom
+
+    def _refresh_clip(self) -> None:
+        first, last = self._visible_lines()
+        self.hl.clip = (first - CLIP_MARGIN, last + CLIP_MARGIN)
+
+    def _schedule_viewport_redraw(self) -> None:
+        """スクロール・リサイズが続く間は塗り直さず、落ち着いてから 1 回だけ確かめる"""
+        if self._clip_job is not None:
+            self.after_cancel(self._clip_job)
+        self._clip_job = self.after(30, self._on_viewport_change)
+
+    def _on_viewport_change(self) -> None:
+        self._clip_job = None
+        if not self.hl.regex or not self.hl.matches and not self.hl.re_spans:
+            return
+        clip = self.hl.clip
+        if clip is None:
+            return   # まだ窓全体を塗っている
+        # Tk に @x,y を問い合わせず、届いている表示割合から見えている行を見積もる（±1 行は余白が吸収）
+        total = self._window_len + 1       # 末尾の空行ぶん
+        first = self._view_start + int(self._yview[0] * total) + 1
+        last = self._view_start + int(self._yview[1] * total) + 1
+        if clip[0] <= first and last <= clip[1]:
+            return   # 見えている範囲は塗り済み
+        self._redraw_only(reveal=False)
+
+    def _reveal_line(self, line_no: int) -> None:
+        """論理行 line_no（1 始まり）が窓の外なら、その行が中央付近に来るよう窓を移す"""
+        k = line_no - 1
+        if not (self._view_start <= k < self._view_start + VIEW_ROWS):
+            self._render_window(k - VIEW_ROWS // 2)
+            # 移した先で見える範囲に合わせて clip も取り直す（移す前の clip のまま塗らない）
+            self.row_text.see(f"{k - self._view_start + 1}.0")
+            self._refresh_clip()
+
+    def _schedule_status(self):
+        """ステータス集計をアイドル時 1 回にまとめる（連続したフィルタ・再描画で何度も組み立てない）"""
+        if self._status_pending:
+            return
+        self._status_pending = True
+        self.after_idle(self._flush_status)
 
-        one_hits = two_hits = 0
+    def _flush_status(self):
+        if not self._status_pending:
+            return   # 予約後に明示メッセージが出たので上書きしない
+        self._status_pending = False
+        self._update_status_counts()
 
-        for i in self.display_indices:
-            if i < 0 or i >= len(self.rows):
-                continue
-            line = ",".join(self.rows[i])
-            m_re = RE_FIELD.search(line)
-            if not m_re:
-                continue
-            tail = line[m_re.end():]
-
-            for m in pat.finditer(tail):
-                try:
-                    code = m.group('code') if ('code' in m.re.groupindex) else m.group(1)
-                except IndexError:
-                    code = m.group(0)
-                norm = code.replace("-", "")
-                hy = code.split("-",1)[1] if "-" in code else ""
-                if mode == 2 and len(norm) == L + 2 and ((hy and hy in twos) or (not hy and norm[-2:] in twos)):
-                    two_hits += 1
-                elif mode == 1 and len(norm) == L + 1 and ((hy and hy in ones) or (not hy and norm[-1:] in ones)):
-                    one_hits += 1
-
-        return (one_hits + two_hits), one_hits, two_hits
+    def _set_status(self, text: str):
+        """明示メッセージを表示（予約中の集計表示で上書きされないよう取り消す）"""
+        self._status_pending = False
+        self._status_is_counts = False
+        self.status.set(text)
+
+    def _show_status_counts(self):
+        """集計表示 + 大きいファイルでは Text に展開中の行範囲を出す"""
+        parts = list(self._status_parts)
+        n = len(self.display_indices)
+        if parts and n > VIEW_ROWS:
+            parts.insert(1, f"{self._view_start + 1}〜{min(self._view_start + VIEW_ROWS, n)} 行目を展開中")
+        self._status_is_counts = True
+        self.status.set(" / ".join(parts))
 
     def _update_status_counts(self):
         """表示行数とハイライト件数 + RE統計 + 枝番統計（登録数＆ヒット数）をステータスへ反映"""
@@ -242,18 +504,19 @@ class UKEEditorGUI(tk.Tk):
 
         # 枝番モードがオフ以外のときだけ統計を追加
         if self.br_mode.get() != 0:
-            try:
-                ones_cnt = len(bm.list_suffixes(1))
-                twos_cnt = len(bm.list_suffixes(2))
-            except Exception:
-                ones_cnt = twos_cnt = 0
+            # 登録数は手元の集合から（集計のたびに JSON を読み直さない）
+            ones_cnt = len(self._suffix_sets[1])
+            twos_cnt = len(self._suffix_sets[2])
 
-            br_total, br_1hit, br_2hit = self._count_branch_hits()
+            # ヒット数は走査（ワーカー）で数え済みの値を読むだけ
+            br_1hit, br_2hit = self.hl.branch_hits if self.hl.regex else (0, 0)
+            br_total = br_1hit + br_2hit
             status_parts.append(f"枝番 登録: 1桁 {ones_cnt}・2桁 {twos_cnt}")
             status_parts.append(f"枝番ヒット: 合計 {br_total}（1桁 {br_1hit}・2桁 {br_2hit}）")
             status_parts.append(f"モード: {self._branch_mode_label()}")
 
-        self.status.set(" / ".join(status_parts))
+        self._status_parts = status_parts
+        self._show_status_counts()
 
     def _refresh_suffix_panel(self):
         """branch_manager から取得して表示を更新"""
@@ -269,17 +532,42 @@ class UKEEditorGUI(tk.Tk):
         self.suffix_twos_var.set(_fmt(twos))
 
     # --- Listbox フィルタ ---
+    def _schedule_filter(self, evt) -> None:
+        """矢印キーで一覧を送る間は絞り込まず、選択が 50ms 止まってから 1 回だけ絞り込む"""
+        if self._filter_job is not None:
+            self.after_cancel(self._filter_job)
+        self._filter_job = self.after(50, self.filter_by_code, evt)
+
     def filter_by_code(self, _evt):
+        if self._filter_job is not None:
+            # 直接呼ばれた（全行表示ボタン）ときは予約中の絞り込みを捨てる
+            self.after_cancel(self._filter_job)
+            self._filter_job = None
         sel = self.row_lb.curselection()
-        self.display_indices = (
-            list(range(len(self.rows))) if not sel else
-            [i for i, r in enumerate(self.rows)
-            if r[DISPLAY_COL].startswith(self.row_lb.get(sel[0]))]
-        )
+        code = self.row_lb.get(sel[0]) if sel else None
+        # 同じコードを選び直しただけなら表示は変わらないので作り直さない（「全行表示」ボタンは常にやり直す）
+        if _evt is not None and code == self._filter_code:
+            return
+        self._filter_code = code
+        if not code:
+            # 未選択、または空コード（先頭列が空の行）は前方一致で全行に当たる
+            self.display_indices = range(len(self.rows))
+        elif len(code) == 2:
+            # 2文字コードは索引を引くだけ
+            self.display_indices = self._prefix_index.get(code, [])
+        else:
+            # 1文字コードは全行ではなく索引のキー（コードの種類数だけ）に対して前方一致し、
+            # 当たったキーの行番号（各々昇順）を 1 本にまとめる
+            hits = [idx for key, idx in self._prefix_index.items() if key.startswith(code)]
+            self.display_indices = hits[0] if len(hits) == 1 else sorted(itertools.chain.from_iterable(hits))
         self._build_text()
 
     # ────────────────────────── ハイライト操作 ──────────────────────────
-    def _setup_highlighter(self):
+    def _setup_highlighter(self) -> re.Pattern:
+        """
+        現在の設定を Highlighter へ反映し、走査に使うパターンを返す。
+        パターン（hl.regex）はここでは差し替えない（走査結果が届いた時点で結果と一緒に差し替える）
+        """
         base = self.patient_code_len
         mode = self.br_mode.get()
         self.hl.set_base_code_len(self.patient_code_len)
@@ -306,71 +594,144 @@ class UKEEditorGUI(tk.Tk):
             detect_mode=self.detect_mode.get(),
             custom_sym=self.custom_sym.get()
         )
-        self.hl.set_regex(pattern)
         self.highlight_pat = pattern
         self.hl.detect_mode_current = self.detect_mode.get()
 
         self.hl.set_branch_mode(
             self.br_mode.get(),
-            bm.list_suffixes(1), bm.list_suffixes(2)
+            self._suffix_sets[1], self._suffix_sets[2]   # 登録・保存開始時に読み直した集合（再描画ごとに JSON を読まない）
         )
+        return pattern
+
+    def _request_highlight(self, focus: int | None = None):
+        """
+        現在の設定で走査し直して描画する（ボタン・フィルタ・読み込み・設定変更の共通入口）。
+        走査はワーカースレッドで行い、UI は応答可能なまま結果を待つ。
+        focus: -1 = 全件表示 / 0 = 先頭の 1 件を強調 / None = 今の表示のまま
+        """
+        pattern = self._setup_highlighter()
+        key = (pattern.pattern, self.hl.detect_mode_current, self._view_version)
+        self._cancel_highlight_job()
+        if key == self._last_scan_key:
+            # パターンも表示内容も同じ → 枝番区間だけ作り直して描画
+            self.hl.refresh_branch_spans()
+            self._finish_highlight(focus)
+            return
+        if self._last_scan_key is not None and self._last_scan_key[2] != self._view_version:
+            # 表示内容が変わったので、結果が届くまで古い区間は塗らない
+            self.hl.reset()
+            self.hl.clear()
+        self._hl_job += 1
+        job = self._hl_job
+        self._hl_pending = (pattern, key, focus)
+        # display_indices・line_starts は差し替えるだけで書き換えないので、コピーせずそのまま渡す
+        args = (self._row_csv, self.display_indices, self.line_starts, pattern, self.rows)
+        threading.Thread(target=self._highlight_worker, args=(job, *args), daemon=True).start()
+        self._set_status("ハイライト計算中…")
+        if not self._hl_waiting:
+            self._hl_waiting = True
+            self.after(30, self._drain_highlight)
+
+    def _highlight_worker(self, job: int, lines, display_indices, line_starts, pattern, rows):
+        """別スレッド：Tk には触らず計算だけしてキューへ渡す"""
+        try:
+            result: object = self.hl.compute(lines, display_indices, line_starts, regex=pattern, rows=rows)
+        except Exception as e:
+            result = e
+        self._hl_queue.put((job, result))
+
+    def _drain_highlight(self):
+        """メインスレッド：キューを見て最新 job の結果だけを描画する"""
+        while True:
+            try:
+                job, result = self._hl_queue.get_nowait()
+            except queue.Empty:
+                break
+            if job != self._hl_job:
+                continue  # 途中で別の操作が入った古い結果
+            self._hl_waiting = False
+            if isinstance(result, Exception):
+                self._hl_pending = None
+                self._schedule_status()   # 「ハイライト計算中…」のまま残さない
+                messagebox.showerror("ハイライト失敗", str(result))
+                return
+            pattern, key, focus = self._hl_pending
+            # パターンは結果と同時に差し替える（待つ間の再描画は前回の結果と前回のパターンのまま）
+            self.hl.set_regex(pattern)
+            self.hl.apply(result)
+            self._last_scan_key = key
+            self._finish_highlight(focus)
+            return
+        if self._hl_waiting:
+            self.after(30, self._drain_highlight)
+
+    def _finish_highlight(self, focus: int | None):
+        """走査結果（または再利用した前回の結果）を描画してステータスを更新"""
+        if focus == 0:
+            if not self.hl.matches:
+                messagebox.showinfo("検索結果", "該当する患者コードは見つかりませんでした。"); return
+            self.hl.draw_single(0)
+            self._set_status(
+                f"表示 {self.visible_count} 行　/　ハイライト {len(self.hl.matches)} 件"
+                f"　(1 / {len(self.hl.matches)})"
+            )
+            return
+        if focus == -1:
+            self.hl.focus_idx = -1
+        self._redraw_only()
+        self._schedule_status()
+
+    def _cancel_highlight_job(self):
+        """実行中のバックグラウンド走査の結果を無効化する"""
+        self._hl_job += 1
+        self._hl_waiting = False
+
+    def _highlight_active(self) -> bool:
+        """ハイライト表示中（または最初の走査を待っている）か"""
+        return self.hl.regex is not None or self._hl_waiting
 
     def highlight_all_matches(self):
         if not self.rows:
             messagebox.showwarning("警告", "まずファイルを読み込んでください"); return
-        self._setup_highlighter()
-        self.hl.scan(self.rows, self.display_indices, self.line_starts)
-        self.hl.draw_all()
-        self._update_status_counts() 
+        self._request_highlight(focus=-1)
 
     def highlight_first_match(self):
         if not self.rows: return
-        self._setup_highlighter()
-        self.hl.scan(self.rows, self.display_indices, self.line_starts)
-        if not self.hl.matches:
-            messagebox.showinfo("検索結果", "該当する患者コードは見つかりませんでした。"); return
-        self.hl.draw_single(0)
-        self._update_status_counts() 
-        self.status.set(
-            f"表示 {self.visible_count} 行　/　ハイライト {len(self.hl.matches)} 件"
-            f"　(1 / {len(self.hl.matches)})"
-        )
+        self._request_highlight(focus=0)
 
     def highlight_next_match(self):
         if not self.hl.matches:
             self.highlight_first_match(); return
         self.hl.draw_single(self.hl.focus_idx + 1)
-        self._update_status_counts() 
-        self.status.set(
+        self._set_status(
             f"表示 {self.visible_count} 行　/　ハイライト {len(self.hl.matches)} 件"
             f"　({self.hl.focus_idx+1} / {len(self.hl.matches)})"
         )
 
     def _apply_highlight(self):
-        """スクロールやフィルター更新時に再描画"""
-        if not self.hl.regex: return
-        self._setup_highlighter()
-        self.hl.scan(self.rows, self.display_indices, self.line_starts)
+        """フィルター更新・読み込み・設定変更時に再描画（ハイライト表示中のときだけ）"""
+        if not self._highlight_active(): return
+        self._request_highlight()
+
+    def _redraw_only(self, reveal: bool = True):
+        """走査結果はそのままでタグだけ描き直す（画面付近の行だけ）"""
+        self._refresh_clip()
         if self.hl.focus_idx >= 0:
-            self.hl.draw_single(self.hl.focus_idx)
+            self.hl.draw_single(self.hl.focus_idx, reveal=reveal)
         else:
             self.hl.draw_all()
-        
-        self._update_status_counts()
 
     def clear_highlight(self):
+        self._cancel_highlight_job()
         self.hl.regex = None; self.hl.matches.clear(); self.hl.focus_idx = -1
-        self.row_text.config(state="normal")
-        self.row_text.tag_remove("hit", "1.0", "end")
-        self.row_text.tag_remove("single", "1.0", "end")
-        self.row_text.tag_remove("branch", "1.0", "end")
-        self.row_text.tag_remove("prefix", "1.0", "end")   
-        self.row_text.tag_remove("re", "1.0", "end") 
-        self.row_text.config(state="disabled")
-        self.status.set(f"表示 {self.visible_count} 行　/　ハイライト 0 件")
+        self.highlight_pat = None
+        self._last_scan_key = None
+        self.hl.clear()
+        self._set_status(f"表示 {self.visible_count} 行　/　ハイライト 0 件")
 
     # --- 枝番モード変更時に即時再描画 ---
     def _refresh_branch_mode(self):
+        # 任意記号モードではパターンが変わらないので、_apply_highlight 内で描画のみになる
         self._apply_highlight()
     
     def _branch_mode_label(self) -> str:
@@ -386,10 +747,11 @@ class UKEEditorGUI(tk.Tk):
         try:
             normalized = suffix.lstrip("-")          # ★ハイフンを落として保存
             bm.register_suffix(normalized)
+            self._reload_suffix_sets()
             msg = f"枝番 {suffix} を登録しました（保存値: {normalized}）"
             messagebox.showinfo("登録完了", msg)
             self._refresh_suffix_panel()
-            self._update_status_counts()
+            self._schedule_status()
         except Exception as e:
             messagebox.showerror("エラー", str(e))
 
@@ -403,12 +765,16 @@ class UKEEditorGUI(tk.Tk):
         messagebox.showinfo("枝番一覧", body.strip())
 
     # ---------- 変換ユーティリティ ----------
+    def _reload_suffix_sets(self) -> None:
+        """登録済み枝番を branch_manager から読み直し、桁数ごとの frozenset に持ち替える"""
+        self._suffix_sets = {1: frozenset(bm.list_suffixes(1)), 2: frozenset(bm.list_suffixes(2))}
+
     def _strip_branch(self, code: str) -> str:
         L = self.patient_code_len
         mode = self.br_mode.get()
-        if mode == 1 and len(code) == L + 1 and code[-1:] in bm.list_suffixes(1):
+        if mode == 1 and len(code) == L + 1 and code[-1:] in self._suffix_sets[1]:
             return code[:-1]
-        elif mode == 2 and len(code) == L + 2 and code[-2:] in bm.list_suffixes(2):
+        elif mode == 2 and len(code) == L + 2 and code[-2:] in self._suffix_sets[2]:
             return code[:-2]
         return code
     
@@ -416,8 +782,8 @@ class UKEEditorGUI(tk.Tk):
         # ★ハイフン枝番：登録済みのときだけ左側採用
         if "-" in raw:
             left, right = raw.split("-", 1)
-            if (self.br_mode.get() == 2 and right in bm.list_suffixes(2)) or \
-            (self.br_mode.get() == 1 and right in bm.list_suffixes(1)):
+            mode = self.br_mode.get()
+            if mode in (1, 2) and right in self._suffix_sets[mode]:
                 raw = left  # 枝番除去
 
         raw = self._strip_branch(raw)      # 連結型の枝番はここで除去（長さガード済み）
@@ -429,11 +795,7 @@ class UKEEditorGUI(tk.Tk):
           - 短くする: 左（先頭）から切り落とす
           - 長くする: 左側に 0 を追加
         """
-        L = self.patient_code_conv_len
-        if len(code) > L:          # 長い → 左からカット
-            return code[-L:]
-        else:                      # 短い／同じ → 0 埋め
-            return code.zfill(L)
+        return _normalize(code, self.patient_code_conv_len)   # 桁数もキーに含むので設定変更で消す必要はない
 
     def _format_code_force_branch_general(self, raw: str, in_len: int, out_len: int) -> str:
         """
@@ -447,21 +809,48 @@ class UKEEditorGUI(tk.Tk):
             return s
         return s[-out_len:].zfill(out_len)
 
+    def _requote_unchanged_rows(self, out_lines: list[str]) -> None:
+        """
+        フィールド内にカンマ・改行を含む行は "," 結合だと列がずれるので、
+        未変換のまま出力する行に限り csv.writer で引用符付きの 1 行に組み直す
+        （それ以外の行は csv.writer でも "," 結合と同じ文字列になる）
+        """
+        rows, joined = self.rows, self._row_csv
+        broken = self._requote_rows   # 読み込み時に求めてある
+        if not broken:
+            return
+        buf = io.StringIO()
+        # 改行を含むフィールドも引用符で囲ませるため、行末は CRLF で書かせてから落とす
+        writer = csv.writer(buf, lineterminator="\r\n")
+        for i in broken:
+            if out_lines[i] is not joined[i]:
+                continue   # 変換・手動変換で書き換えた行はそのまま
+            buf.seek(0); buf.truncate()
+            writer.writerow(rows[i])
+            out_lines[i] = buf.getvalue()[:-2]
+
+    def _uke_bytes(self, out_lines: list[str]) -> bytes:
+        """保存する UKE 本体（Shift-JIS/CRLF）。未変換で列がずれる行を組み直してから全体を 1 回でエンコード"""
+        self._requote_unchanged_rows(out_lines)
+        return ("\r\n".join(out_lines) + "\r\n").encode("cp932")
+
     def convert_and_save(self):
         if not self.rows:
             messagebox.showwarning("警告", "まず CSV ファイルを読み込んでください。")
             return
-        if self.hl.regex is None:
+        pat = self.highlight_pat   # 直近の設定のパターン（走査待ちでも hl.regex は前回のまま）
+        if pat is None:
             messagebox.showinfo("情報", "ハイライトされた患者コードがありません。")
             return
 
-        pat = self.hl.regex
         tc  = "," * self.trailing_commas
-        RE_FIELD = re.compile(r'(^|,)\s*"?RE"?\s*(,|$)', re.IGNORECASE)
+        re_finditer = RE_FIELD.finditer
+        self._reload_suffix_sets()   # 保存中は枝番集合を固定
 
-        out_lines: list[str] = []
-        # [line_no, old_code, new_code, old_line, new_line, method]
-        changes_rows: list[list[str]] = []
+        # 未変更行は何もしなくてよいよう、元の行をそのまま複製しておき変換行だけ上書きする
+        out_lines: list[str] = self._row_csv[:]
+        # (line_no, old_code, new_code, old_line, new_line, method)
+        changes_rows: list[tuple] = []
 
         # 集計カウンタ
         re_token_total = 0          # RE の出現回数（トークン数）
@@ -482,80 +871,86 @@ class UKEEditorGUI(tk.Tk):
         # フォールバックで落とす桁（枝番モードに追随）
         fallback_drop = 2 if self.br_mode.get() == 2 else (1 if self.br_mode.get() == 1 else 0)
 
-        for idx, row in enumerate(self.rows, 1):  # 行番号は1始まり
-            line = ",".join(row)
-            # 元行のカンマ個数（検証用）
-            orig_commas = line.count(',')
-
-            # 行内の RE を全件カウント（通常は1件想定だが念のため）
-            re_all = list(RE_FIELD.finditer(line))
-            re_token_total += len(re_all)
-
-            # 変換は先頭の RE 以降のみ
-            m_re = re_all[0] if re_all else None
-            if not m_re:
-                out_lines.append(line)
-                no_re_rows.append((idx, line))
+        # ループ内で毎回引かないよう、設定値（Tk 変数の get を含む）とメソッドを先にローカルへ
+        L = self.patient_code_len
+        conv_len = self.patient_code_conv_len
+        custom_mode = self.detect_mode.get() == 1
+        code_grp = 'code' if 'code' in pat.groupindex else 1
+        sym_grp = 'sym' if 'sym' in pat.groupindex else None
+        _format_code = self._format_code
+        # 同じ患者コードはファイル内で何度も出るので、今回の保存中（設定固定）は結果を使い回す
+        fmt_cache: dict[str, str] = {}
+        _pat_subn = pat.subn
+        _changes_append = changes_rows.append
+        _no_re_append = no_re_rows.append
+        _nomatch_append = re_nomatch_rows.append
+
+        # 置換コールバック（idx / line / per_line_changes はループ側の現在値を参照する）
+        def _repl(m: re.Match) -> str:
+            nonlocal converted_total, fallback_total
+            old = m.group(code_grp)
+            new = fmt_cache.get(old)  # 通常処理
+            if new is None:
+                new = fmt_cache[old] = _format_code(old)
+            method = "normal"
+
+            # ★通常処理で不変 かつ 「枝番付き長さ」のときだけ発動
+            if new == old and fallback_drop > 0 and old.isdigit() and len(old) == L + fallback_drop:
+                forced_core = old[:-fallback_drop]
+                forced_new  = _normalize(forced_core, conv_len)
+                if forced_new != old:
+                    new = forced_new
+                    method = "fallback"
+                    fallback_total += 1
+
+            if new != old:
+                converted_total += 1
+            else:
+                # 旧→新が同一（normal時）。“元と変換後の桁数が一致”の代表ケースとして記録
+                if old.isdigit() and len(old) == conv_len and idx not in unchanged_same_len_seen:
+                    unchanged_same_len_rows.append((idx, line))  # 行全体を保存
+                    unchanged_same_len_seen.add(idx)
+
+            per_line_changes.append((old, new, method))
+            if custom_mode:
+                # 任意記号モード：named group 'sym' を優先してそのまま再挿入
+                if sym_grp is not None:
+                    suffix = m.group(sym_grp)
+                else:
+                    suffix = m.group(m.lastindex) if (m.lastindex and m.lastindex >= 2) else tc
+                return "," + new + suffix
+            else:
+                # 後方カンマモード：設定個数で正規化
+                return "," + new + tc
+
+        for idx, (line, re_end) in enumerate(zip(self._row_csv, self._re_end), 1):  # 行番号は1始まり
+            # 変換は先頭の RE 以降のみ（RE 位置は読み込み時に求めてある）
+            if re_end < 0:
+                _no_re_append((idx, line))
                 continue
 
-            head = line[:m_re.end()]         # REまで（含む）
-            tail = line[m_re.end():]         # RE以降のみ置換対象
+            head = line[:re_end]             # REまで（含む）
+            tail = line[re_end:]             # RE以降のみ置換対象
 
-            # 置換対象のマッチを先に列挙して件数集計
-            matches = list(pat.finditer(tail))
-            target_total += len(matches)
-            if not matches:
-                out_lines.append(line)
-                re_nomatch_rows.append((idx, line))
-                continue
+            # 行内の RE を全件カウント（通常は1件想定だが念のため）。2件目以降は tail 側にしか無い
+            re_token_total += 1
+            if _may_have_re(tail):
+                re_token_total += sum(1 for _ in re_finditer(line, re_end))
 
             # この行の変更記録（置換後に fixed_line を付けてCSVに書く）
             per_line_changes: list[tuple[str, str, str]] = []  # (old, new, method)
 
-            def _repl(m: re.Match) -> str:
-                nonlocal converted_total, fallback_total
-                old = m.group('code') if ('code' in m.re.groupindex) else m.group(1)
-                new = self._format_code(old)   # 通常処理
-                method = "normal"
-
-                L = self.patient_code_len
-                drop = 2 if self.br_mode.get() == 2 else (1 if self.br_mode.get() == 1 else 0)
-
-                # ★通常処理で不変 かつ 「枝番付き長さ」のときだけ発動
-                if new == old and drop > 0 and old.isdigit() and len(old) == L + drop:
-                    forced_core = old[:-drop]
-                    forced_new  = self._normalize_code(forced_core)
-                    if forced_new != old:
-                        new = forced_new
-                        method = "fallback"
-                        fallback_total += 1
-
-                if new != old:
-                    converted_total += 1
-                else:
-                    # 旧→新が同一（normal時）。“元と変換後の桁数が一致”の代表ケースとして記録
-                    try:
-                        if old.isdigit() and len(old) == self.patient_code_conv_len and idx not in unchanged_same_len_seen:
-                            unchanged_same_len_rows.append((idx, line))  # 行全体を保存
-                            unchanged_same_len_seen.add(idx)
-                    except Exception:
-                        pass             
-
-                per_line_changes.append((old, new, method))
-                if self.detect_mode.get() == 1:
-                    # 任意記号モード：named group 'sym' を優先してそのまま再挿入
-                    try:
-                        suffix = m.group('sym')
-                    except Exception:
-                        suffix = m.group(m.lastindex) if (m.lastindex and m.lastindex >= 2) else tc
-                    return f",{new}{suffix}"
-                else:
-                    # 後方カンマモード：設定個数で正規化
-                    return f",{new}{tc}"
+            # 置換と件数集計を 1 回の走査で（0 件ならコールバックは呼ばれず副作用も無い）
+            tail_fixed, n_hit = _pat_subn(_repl, tail)
+            target_total += n_hit
+            if not n_hit:
+                _nomatch_append((idx, line))
+                continue
 
-            tail_fixed = pat.sub(_repl, tail)
+            # カンマ数検証用（置換する行だけ数える）
+            orig_commas = line.count(',')
             fixed_line = head + tail_fixed
-            out_lines.append(fixed_line)
+            out_lines[idx - 1] = fixed_line
 
             # カンマ数検証（変更が入った行のみ対象）
             new_commas = fixed_line.count(',')
@@ -564,7 +959,7 @@ class UKEEditorGUI(tk.Tk):
 
             # 変更ログ（converted_line を確定させてからまとめて吐く）
             for old, new, method in per_line_changes:
-                changes_rows.append([str(idx), old, new, line, fixed_line, method])
+                _changes_append((idx, old, new, line, fixed_line, method))
 
         unchanged_total = max(0, target_total - converted_total)
         
@@ -612,10 +1007,10 @@ class UKEEditorGUI(tk.Tk):
 
         out_path = Path(save_path)
 
-        # ---- UKE本体を書き出し（Shift-JIS/CRLF）----
-        with out_path.open("w", encoding="cp932", newline="") as f:
-            for L in out_lines:
-                f.write(f"{L}\r\n")
+        # ---- UKE本体を書き出し（Shift-JIS/CRLF）：全体を一度だけエンコードして書く ----
+        data = self._uke_bytes(out_lines)
+        with out_path.open("wb") as f:
+            f.write(data)
 
         # ---- 変更ログCSV・集計ログは『選んだファイル名』基準で同じフォルダへ ----
         out_dir = out_path.parent
@@ -625,13 +1020,15 @@ class UKEEditorGUI(tk.Tk):
         try:
             if changes_rows:
                 map_path = out_dir / f"{out_stem}_changes.csv"
-                with map_path.open("w", encoding="cp932", newline="") as f:
-                    writer = csv.writer(f, lineterminator="\r\n")
-                    writer.writerow([
-                        "line_no", "original_code", "converted_code",
-                        "original_line", "converted_line", "method"
-                    ])
-                    writer.writerows(changes_rows)
+                # UKE 本体と同じく、メモリ上で組み立てて cp932 へ 1 回で変換し 1 回で書く
+                buf = io.StringIO()
+                writer = csv.writer(buf, lineterminator="\r\n")
+                writer.writerow([
+                    "line_no", "original_code", "converted_code",
+                    "original_line", "converted_line", "method"
+                ])
+                writer.writerows(changes_rows)
+                map_path.write_bytes(buf.getvalue().encode("cp932"))
         except Exception as e:
             messagebox.showwarning("警告", f"変更ログの保存に失敗しました: {e}")
 
@@ -645,7 +1042,7 @@ class UKEEditorGUI(tk.Tk):
                 detect_label = "後方カンマ" if detect_mode == 0 else "任意の記号"
                 branch_label = self._branch_mode_label()
                 allowed_lens = getattr(self.hl, "allowed_code_lengths", None) or [self.patient_code_len]
-                regex_pat = getattr(self.hl, "regex", None).pattern if getattr(self.hl, "regex", None) else "(none)"
+                regex_pat = pat.pattern   # 実際に変換に使ったパターン（hl.regex は走査待ちだと前回のまま）
                 suf1 = " ".join(bm.list_suffixes(1)) or "(なし)"
                 suf2 = " ".join(bm.list_suffixes(2)) or "(なし)"
                 f.write(f"Noise Marks        : {getattr(self, 'noise_marks', '') or '(なし)'}\r\n")
@@ -721,14 +1118,14 @@ class UKEEditorGUI(tk.Tk):
         else:
             msg += "\nカンマ数検証: OK"
         messagebox.showinfo("完了", msg)
-        self.status.set(f"保存完了: {out_path.name}（自動 {converted_total}/{target_total} 件, 手動 {manual_converted_total} 件, Fallback {fallback_total} 件）")
+        self._set_status(f"保存完了: {out_path.name}（自動 {converted_total}/{target_total} 件, 手動 {manual_converted_total} 件, Fallback {fallback_total} 件）")
 
     def _manual_convert_dialog(self, *,
                             candidates_no_re: list[tuple[int, str]],
                             candidates_re_nomatch: list[tuple[int, str]] | None = None,
                             candidates_same_len: list[tuple[int, str]] | None = None,
                             out_lines: list[str],
-                            changes_rows: list[list[str]]) -> tuple[int, int]:
+                            changes_rows: list[tuple]) -> tuple[int, int]:
         """
         返戻等でRE起因の未変換行を「レコード表示」し、列見出しクリック/セルダブルクリックで
         変換対象列を選んで一括変換する。
@@ -867,17 +1264,20 @@ class UKEEditorGUI(tk.Tk):
             tree.column("__line__", width=60, stretch=False)
             tree.column("__type__", width=130, stretch=False)
 
-            # 既存データクリア
-            for iid in tree.get_children():
-                tree.delete(iid)
+            # 既存データクリア（1 回の delete にまとめて渡す）
+            children = tree.get_children()
+            if children:
+                tree.delete(*children)
 
             # 行投入
             def _target_text(ln: int) -> str:
                 return f"C{overrides[ln]+1}" if ln in overrides else "-"
+            # Treeview に一括挿入は無いので、1 行ぶんの値はリスト連結だけで作り insert を直接呼ぶ
+            tree_insert = tree.insert
             for tag, ln, orig, fields in visible_rows:
-                row_vals = [ln, tag, _target_text(ln)] + [fields[i] if i < len(fields) else "" for i in range(max_cols)]
-
-                tree.insert("", "end", iid=str(ln), values=row_vals)
+                # max_cols は全行の最大列数なので、足りない分を "" で埋めるだけでよい
+                row_vals = [ln, tag, _target_text(ln)] + fields + [""] * (max_cols - len(fields))
+                tree_insert("", "end", iid=str(ln), values=row_vals)
 
             # 見出しの選択状態を再描画
             _refresh_heading_selected()
@@ -974,7 +1374,7 @@ class UKEEditorGUI(tk.Tk):
                     fields[tcol] = new_code
                     new_line = ",".join(fields)
                     out_lines[ln - 1] = new_line  # 1始まり→0始まり
-                    changes_rows.append([str(ln), old, new_code, orig, new_line, f"manual(C{tcol+1})"])
+                    changes_rows.append((ln, old, new_code, orig, new_line, f"manual(C{tcol+1})"))
                     converted += 1
             # 累計更新＆表示。ダイアログは閉じずに続けて操作できる
             nonlocal total_converted, total_skipped
@@ -1033,7 +1433,8 @@ class UKEEditorGUI(tk.Tk):
         skipped: List[str] = []
         for fp in self.tk.splitlist(fps):
             path = Path(fp)
-            m = re.match(r"^(.*?)(\.UKE)(.*)$", path.name, flags=re.IGNORECASE)
+            # ".uke" を含まない名前は正規表現にかけるまでもなく対象外
+            m = _UKE_NAME_RE.match(path.name) if ".uke" in path.name.lower() else None
             if not m:
                 skipped.append(path.name)
                 continue
@@ -1057,7 +1458,12 @@ class UKEEditorGUI(tk.Tk):
         messagebox.showinfo("リネーム結果", msg)
 
     # ---------- 設定ダイアログ ----------
-    def _apply_settings(self, len_v, conv_v, comma_v, noise_v, dlg):
+    def _highlight_settings(self) -> tuple:
+        """ハイライト結果を左右する設定（変換桁数は含まない）"""
+        return (self.patient_code_len, self.trailing_commas, getattr(self, "noise_marks", None),
+                self.detect_mode.get(), self.custom_sym.get())
+
+    def _apply_settings(self, len_v, conv_v, comma_v, noise_v, dlg, hl_before: tuple | None = None):
         self.patient_code_len      = len_v.get()
         self.patient_code_conv_len = conv_v.get()
 
@@ -1074,15 +1480,18 @@ class UKEEditorGUI(tk.Tk):
         except Exception:
             self.noise_marks = getattr(self, "noise_marks", "*＊※★")
 
-        self.status.set(
+        self._set_status(
             f"設定変更: ハイライト桁数={self.patient_code_len} / "
             f"変換桁数={self.patient_code_conv_len} / "
             f"後方カンマ数={self.trailing_commas} / 枝番モード={self.br_mode.get()}"
         )
-        self._apply_highlight()
+        # 変換桁数だけの変更ならハイライトは変わらないので、再構築・再描画しない
+        if hl_before is None or self._highlight_settings() != hl_before:
+            self._apply_highlight()
         dlg.destroy()
     
     def open_settings(self):
+        hl_before = self._highlight_settings()   # ダイアログ内の判定ロジック変更も即時に Tk 変数へ入るので開いた時点で控える
         dialog = tk.Toplevel(self)
         dialog.title("設定")
         dialog.geometry("+{}+{}".format(
@@ -1158,7 +1567,7 @@ class UKEEditorGUI(tk.Tk):
         btn_frame = tk.Frame(dialog)
         btn_frame.grid(row=btn_row, column=0, columnspan=4, pady=8, sticky="w")
         tk.Button(btn_frame, text="OK", width=8,
-                command=lambda: self._apply_settings(len_var, conv_var, comma_var, noise_var, dialog)
+                command=lambda: self._apply_settings(len_var, conv_var, comma_var, noise_var, dialog, hl_before)
                 ).pack(side="right")
 
         dialog.grab_set()
@@ -1181,7 +1590,10 @@ class UKEEditorGUI(tk.Tk):
         """現在のウィンドウサイズ・位置を保存して終了"""
         try:
             p = Path.home() / ".uke_editor_ui.json"
-            p.write_text(json.dumps({"geometry": self.geometry()}), encoding="utf-8")
+            # 一時ファイルに書いてから置き換え（途中で落ちても壊れたファイルを残さない）
+            tmp = p.with_suffix(".tmp")
+            tmp.write_bytes(json.dumps({"geometry": self.geometry()}).encode("utf-8"))
+            os.replace(tmp, p)
         except Exception:
             # 保存失敗しても終了は継続
             pass
@@ -1254,10 +1666,9 @@ class UKEEditorGUI(tk.Tk):
             "  - ',00071843-02****,,,,,'  → ノイズ ‘****’ は除去、カンマ列は保持\n"
             "  - ',20250131,,'            → 後方カンマ数が合わなければヒットせず変換対象外\n"
         )
-        self.row_text.config(state="normal")
-        self.row_text.delete("1.0", "end")
-        self.row_text.insert("1.0", HELP_TEXT)
-        self.row_text.config(state="disabled")
+        with self._editable():
+            self.row_text.delete("1.0", "end")
+            self.row_text.insert("1.0", HELP_TEXT)
 
 
 if __name__ == "__main__":
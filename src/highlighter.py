@@ -3,10 +3,61 @@
 
 from __future__ import annotations
 
+import bisect
+import functools
+import itertools
+import operator
 import tkinter as tk 
 import re
-from typing import List, Tuple
+from typing import Iterable, List, Sequence, Tuple
 
+import numpy as np
+
+# 結合バッファ用の RE フィールド検出（改行をまたがないよう \s の代わりに [^\S\n] を使う）
+_RE_FIELD_BUF = re.compile(r'(?:^|,)[^\S\n]*"?(?P<re>RE)"?[^\S\n]*(?:,|$)', re.IGNORECASE | re.MULTILINE)
+
+_span_line = operator.itemgetter(0)   # 区間の論理行（二分探索のキー）
+
+TAG_BATCH = 500  # 1 回の tag add で付ける区間数（残りはアイドル時に分けて付け、画面を止めない）
+
+
+def _line_numbers(line_starts: Sequence[int], rows: np.ndarray) -> np.ndarray:
+    """表示順（0 始まり）の配列 → 論理行番号の配列。range なら添字を引かずに計算する"""
+    if isinstance(line_starts, range):
+        return line_starts.start + line_starts.step * rows
+    return np.asarray(line_starts, dtype=np.int64)[rows]
+
+
+@functools.lru_cache(maxsize=32)
+def _compile_code_regex(n_digits: int, trailing_commas: int, detect_mode: int, custom_sym: str,
+                        base_code_len: int | None, allowed_lengths: tuple[int, ...] | None,
+                        noise_marks: str | None) -> re.Pattern:
+    """患者コード検出パターンを組み立てて compile（設定が同じなら前回の Pattern を返す）"""
+    # コード直後のノイズ記号。空白の繰り返しが前後で重ならないよう、空白ごと任意グループにまとめる
+    noise = (r"(?:\s*(?P<noise>[" + re.escape(noise_marks) + r"]+))?") if noise_marks else ""
+    if detect_mode == 0:  # 後方カンマ
+        tc = "," * trailing_commas
+        base = base_code_len or n_digits
+        lengths = allowed_lengths or (n_digits,)  # 例: (N, N+2)
+        # 先頭 N 桁は全候補で共通なので 1 回だけ照合し、枝番部分だけを選択肢にする
+        #   例: N=8, [8, 10] → \d{8}(?:\d{2}|-\d{2})?
+        sufs = sorted({L - base for L in lengths if L > base})
+        tails  = [rf"\d{{{suf}}}" for suf in sufs]                     # N+枝番（連結）
+        tails += [rf"-\d{{{suf}}}" for suf in sufs if suf in (1, 2)]   # N-枝番（ハイフン）
+        group = rf"\d{{{base}}}"
+        if tails:
+            bare_ok = any(L <= base for L in lengths)                  # N 桁のみも許容するか
+            group += rf"(?:{'|'.join(tails)})" + ("?" if bare_ok else "")
+        return re.compile(rf",\s*(?P<code>{group})" + noise + rf"\s*{tc}")
+    else:
+        rng = f"{{1,{n_digits}}}"
+        sym = re.escape(custom_sym or "*")
+        # 記号・ノイズが数字で始まらなければ、数字列を短く取り直しても一致しないので
+        # 所有量指定子で後戻りを止める（記号の無い長い数字列で桁数ぶん試し直さない）
+        if not any(ch.isdigit() for ch in (custom_sym or "*")[:1] + (noise_marks or "")):
+            rng += "+"
+        code_pat = rf"\d{rng}(?:-\d{{1,2}})?"
+        return re.compile(rf",\s*(?P<code>{code_pat})" + noise + rf"\s*(?P<sym>{sym})")
 
 
 class Highlighter:
@@ -25,25 +76,40 @@ class Highlighter:
         # 状態
         self.regex: re.Pattern | None = None
         self.branch_mode: int = 0          # 0=off / 1=1桁 / 2=2桁
-        self.br_1d: List[str] = []         # 登録済み枝番1桁
-        self.br_2d: List[str] = []         # 登録済み枝番２桁
+        self.br_1d: frozenset[str] = frozenset()   # 登録済み枝番1桁
+        self.br_2d: frozenset[str] = frozenset()   # 登録済み枝番２桁
         self.base_code_len = None  # 初期桁数        
         self.allowed_code_lengths: list[int] | None = None  # 許容桁数  
         self.noise_marks: str | None = None 
         
-        # (start, end, tag) -- tag は hit / single
-        self.matches: List[Tuple[str, str, str]] = []
+        # 区間は (論理行, 開始桁, 終了桁) の int で持ち、"行.桁" の文字列は塗る分だけ描画時に作る
+        #   いずれも行の昇順に並ぶ（窓・clip の範囲は二分探索で切り出す）
+        # (line, start_col, end_col, tag) -- tag は hit / single
+        self.matches: List[Tuple[int, int, int, str]] = []
         # 枝番だけを塗るための区間
-        self.branch_spans: List[Tuple[str, str]] = []
+        self.branch_spans: List[Tuple[int, int, int]] = []
         self.focus_idx: int = -1           # -1 = 全件モード
-        self.prefix_spans: List[Tuple[str, str]] = [] # ハイフンより前
+        self.prefix_spans: List[Tuple[int, int, int]] = [] # ハイフンより前
+        # 検出コード (line_no, code_start, code)：枝番設定だけ変わったときの再計算用
+        self.code_hits: List[Tuple[int, int, str]] = []
+        self.branch_hits: Tuple[int, int] = (0, 0)   # 登録済み枝番付きコードの件数 (1桁, 2桁)
         
         # RE
-        self.re_spans: list[tuple[str, str]] = []
+        self.re_spans: list[tuple[int, int, int]] = []
         self.re_line_count = 0
         self.no_re_line_count = 0
         self.re_token_count = 0
 
+        # 表示窓：GUI が全行ではなく一部の行だけを Text に入れているときの写し方
+        #   座標は論理行（表示順 1 始まり）で持ち、描画時に view_offset 行ずらす
+        self.view_offset = 0
+        self.view_rows: int | None = None  # 窓の行数（None = 全行が入っている）
+        self.on_reveal = None              # draw_single 前に論理行番号を受け取り、窓外なら窓を移す
+        # 塗る論理行の範囲（両端含む）。画面付近だけ塗るときに GUI が設定（None = 窓全体）
+        self.clip: tuple[int, int] | None = None
+        self._draw_gen = 0                 # タグを消すたびに進める（古い分割付与を捨てる目印）
+        self._tags_drawn = False           # 前回 _clear_tags 以降にタグを付けたか
+
     # ---------------- 設定 ----------------
     def set_regex(self, pattern: re.Pattern | None):
             self.regex = pattern
@@ -51,13 +117,18 @@ class Highlighter:
     def set_branch_mode(
         self,
         mode: int,
-        suffixes_1d: List[str],
-        suffixes_2d: List[str],
+        suffixes_1d: Iterable[str],
+        suffixes_2d: Iterable[str],
     ):
-        """mode=0/1/2 と枝番リストを受け取って内部状態を更新"""
+        """mode=0/1/2 と枝番リストを受け取って内部状態を更新（枝番は照合用に frozenset で持つ）"""
         self.branch_mode = mode
-        self.br_1d = suffixes_1d
-        self.br_2d = suffixes_2d
+        self.br_1d = frozenset(suffixes_1d)
+        self.br_2d = frozenset(suffixes_2d)
+
+    def set_view(self, offset: int, rows: int | None):
+        """Text に入っているのが論理行 offset+1 〜 offset+rows だけであることを設定"""
+        self.view_offset = offset
+        self.view_rows = rows
 
     def set_base_code_len(self, n: int | None):
         self.base_code_len = n
@@ -74,156 +145,292 @@ class Highlighter:
         self.noise_marks = (marks or "").strip() or None
 
     def _build_regex(self, n_digits: int, trailing_commas: int, detect_mode: int, custom_sym: str) -> re.Pattern:
-        if detect_mode == 0:  # 後方カンマ
-            tc = "," * trailing_commas
-            base = self.base_code_len or n_digits
-            lengths = self.allowed_code_lengths or [n_digits]  # 例: [N, N+2]
-            alts = []
-            for L in lengths:
-                suf = L - base
-                if suf <= 0:
-                    alts.append(rf"\d{{{base}}}")              # N
-                else:
-                    alts.append(rf"\d{{{L}}}")                 # N+枝番（連結）
-                    if suf in (1, 2):
-                        alts.append(rf"\d{{{base}}}-\d{{{suf}}}")  # N-枝番（ハイフン）
-            group = "|".join(alts)
-            noise = ""
-            if self.noise_marks:
-                noise = rf"\s*(?P<noise>[" + re.escape(self.noise_marks) + r"]+)?"
-            return re.compile(rf",\s*(?P<code>(?:{group}))" + noise + rf"\s*{tc}")
-        else:
-            rng = f"{{1,{n_digits}}}"
-            sym = re.escape(custom_sym or "*")
-            code_pat = rf"\d{rng}(?:-\d{{1,2}})?"
-            noise = ""
-            if self.noise_marks:
-                noise = rf"\s*(?P<noise>[" + re.escape(self.noise_marks) + r"]+)?"
-            return re.compile(rf",\s*(?P<code>{code_pat})" + noise + rf"\s*(?P<sym>{sym})")
+        lengths = tuple(self.allowed_code_lengths) if self.allowed_code_lengths else None
+        return _compile_code_regex(
+            n_digits, trailing_commas, detect_mode, custom_sym,
+            self.base_code_len, lengths, self.noise_marks,
+        )
 
     # ---------------- スキャン ----------------
-    def scan(self, rows, display_indices, line_starts):
-        """行データを走査して self.matches / self.re_spans を更新"""
-        self.matches.clear()
-        self.branch_spans.clear()
-        self.prefix_spans.clear()
-        self.re_spans.clear()
-        # ★ 統計をリセット
-        self.re_line_count = 0
-        self.no_re_line_count = 0
-        self.re_token_count = 0
-        
-        base = getattr(self, "base_code_len", None)
+    def scan(self, lines, display_indices, line_starts: Sequence[int], rows=None):
+        """
+        行データを走査して self.matches / self.re_spans を更新
+        lines は "," で結合済みの行文字列（GUI 側のキャッシュ）を受け取る
+        line_starts は表示順 → 論理行番号（int。GUI からは range が渡る）
+        rows は元の行リスト（統計で列の無い空行を見分けるのに使う）
+        """
+        self.apply(self.compute(lines, display_indices, line_starts, rows=rows))
 
+    def apply(self, result: dict):
+        """compute() の結果を内部状態へ反映（メインスレッドで呼ぶ）"""
+        self.matches = result["matches"]
+        self.branch_spans = result["branch_spans"]
+        self.prefix_spans = result["prefix_spans"]
+        self.re_spans = result["re_spans"]
+        self.code_hits = result["code_hits"]
+        self.branch_hits = result["branch_hits"]
+        self.re_line_count = result["re_line_count"]
+        self.no_re_line_count = result["no_re_line_count"]
+        self.re_token_count = result["re_token_count"]
+
+    def reset(self):
+        """走査結果を空にする（表示内容が変わって前回の区間が使えないとき。タグは clear() で外す）"""
+        self.apply({
+            "matches": [], "branch_spans": [], "prefix_spans": [], "re_spans": [], "code_hits": [],
+            "branch_hits": (0, 0), "re_line_count": 0, "no_re_line_count": 0, "re_token_count": 0,
+        })
+
+    def compute(self, lines, display_indices, line_starts: Sequence[int],
+                regex: re.Pattern | None = None, rows=None) -> dict:
+        """
+        走査本体。Tk には触らず結果を dict で返すので、ワーカースレッドからも呼べる。
+        設定値は呼び出し時点のものを先に読み出して使う。regex を渡せば self.regex の代わりにそれで走査する
+        （GUI は結果を apply するまで self.regex を差し替えない）。
+        ※ Text の search -regexp は使わない（Text には表示窓の行しか入っておらず、
+          Tcl の正規表現は (?P<code>) などの名前付きグループも扱えないため）
+        """
+        if regex is None:
+            regex = self.regex
+        base = getattr(self, "base_code_len", None)
         detect_mode = getattr(self, "detect_mode_current", 0)
-        if self.regex is None:
-            return
+        branch_mode = self.branch_mode
+        br_1d, br_2d = self.br_1d, self.br_2d
 
-        RE_FIELD = re.compile(r'(?:(^|,))\s*"?RE"?\s*(?:(,|$))', re.IGNORECASE)
+        matches: List[Tuple[int, int, int, str]] = []
+        branch_spans: List[Tuple[int, int, int]] = []
+        prefix_spans: List[Tuple[int, int, int]] = []
+        re_spans: List[Tuple[int, int, int]] = []
+        code_hits: List[Tuple[int, int, str]] = []
+        result = {
+            "matches": matches, "branch_spans": branch_spans,
+            "prefix_spans": prefix_spans, "re_spans": re_spans, "code_hits": code_hits,
+            "branch_hits": (0, 0), "re_line_count": 0, "no_re_line_count": 0, "re_token_count": 0,
+        }
+        if regex is None:
+            return result
 
-        for disp_idx, row_idx in enumerate(display_indices):
-            if not rows[row_idx]:
-                continue
+        # 表示行を 1 本のバッファに結合し、RE は 1 回の finditer で全行まとめて拾う
+        disp_lines = [lines[i] for i in display_indices]
+        n = len(disp_lines)
+        if n == 0:
+            return result
+        lens = np.fromiter(map(len, disp_lines), dtype=np.int64, count=n)
+        offs = np.zeros(n, dtype=np.int64)          # 各行の先頭オフセット
+        np.cumsum(lens[:-1] + 1, out=offs[1:])
+        buf = "\n".join(disp_lines)
+        re_buf = buf
+        if buf.count("\n") != n - 1:
+            # フィールド内の改行は行の区切りと見分けられないので、RE の検出だけは
+            # 改行を空白に置き換えた写しで行う（1 文字ずつなので位置は buf と同じ）
+            re_buf = "\n".join([s.replace("\n", " ") for s in disp_lines])
+
+        re_hits = list(_RE_FIELD_BUF.finditer(re_buf))
+        k = len(re_hits)
+        re_pos  = np.fromiter((m.start("re") for m in re_hits), dtype=np.int64, count=k)
+        re_ends = np.fromiter((m.end() for m in re_hits), dtype=np.int64, count=k)
+        # オフセット → 行番号（表示順 0 始まり）をまとめて変換
+        re_rows = np.searchsorted(offs, re_pos, side="right") - 1
+        re_cols = re_pos - offs[re_rows]
+
+        # ★ 統計（列の無い空行はどちらにも数えない。[""] のような空文字列だけの行は RE なしに数える）
+        per_row = np.bincount(re_rows, minlength=n)
+        result["re_token_count"] = k
+        result["re_line_count"] = int(np.count_nonzero(per_row))
+        blank = lens == 0
+        if rows is not None:
+            for j in np.flatnonzero(blank).tolist():
+                if rows[display_indices[j]]:
+                    blank[j] = False
+        result["no_re_line_count"] = int(np.count_nonzero((per_row == 0) & ~blank))
+
+        # ★ 各 RE の "RE" 文字部分だけ黄色で塗る（行番号・桁は配列のまま求めてから tuple 化）
+        re_spans.extend(zip(_line_numbers(line_starts, re_rows).tolist(),
+                            re_cols.tolist(), (re_cols + 2).tolist()))
+
+        # ★ 既存の患者コードスキャンは「先頭の RE 以降」を対象
+        rows_with_re, first_idx = np.unique(re_rows, return_index=True)
+        grp = 'code' if 'code' in regex.groupindex else 1
+        for line_no, s_col, e_col, code_start, code in self._code_hits_in_tails(
+                regex, grp, buf, offs, lens, rows_with_re, re_ends[first_idx], line_starts):
+            if detect_mode == 1 and "-" in code:
+                prefix_spans.append((line_no, code_start, code_start + code.find('-')))
+
+            code_hits.append((line_no, code_start, code))
+            matches.append((line_no, s_col, e_col, "hit"))
+
+        # 枝番着色
+        branch_spans.extend(self._branch_spans_for(code_hits, base, branch_mode, br_1d, br_2d))
+        result["branch_hits"] = self._branch_hit_counts(code_hits, base, branch_mode, br_1d, br_2d)
+        return result
+
+    @staticmethod
+    def _code_hits_in_tails(regex, grp, buf, offs, lens, rows, starts, line_starts):
+        """
+        各行の RE 以降（starts 〜 行末）を NUL 区切りで 1 本につなぎ、finditer 1 回で拾う。
+        パターンは NUL に一致しないので行をまたがず、行ごとに pos/endpos を指定した走査と同じ結果になる。
+        戻り値: (line_no, 開始桁, 終了桁, コード開始桁, コード) の列（行順）
+        """
+        line_offs = offs[rows]
+        ends = (line_offs + lens[rows]).tolist()
+        starts_l = starts.tolist()
+        if "\x00" in regex.pattern:
+            # 任意記号・ノイズ記号に NUL が入っているときだけ行ごとに走査
+            for line_no, s, e, lo in zip(_line_numbers(line_starts, rows).tolist(), starts_l, ends,
+                                         line_offs.tolist()):
+                for m in regex.finditer(buf, s, e):
+                    yield line_no, m.start() - lo, m.end() - lo, m.start(grp) - lo, m.group(grp)
+            return
+        tails = [buf[s:e] for s, e in zip(starts_l, ends)]
+        n = len(tails)
+        t_offs = np.zeros(n, dtype=np.int64)
+        if n > 1:
+            np.cumsum(np.fromiter(map(len, tails[:-1]), dtype=np.int64, count=n - 1) + 1, out=t_offs[1:])
+        hits = list(regex.finditer("\x00".join(tails)))
+        if not hits:
+            return
+        k = len(hits)
+        m_start = np.fromiter((m.start() for m in hits), dtype=np.int64, count=k)
+        t_idx = np.searchsorted(t_offs, m_start, side="right") - 1
+        # 結合バッファ上の位置 → 行内の桁へのずらし量
+        shift = ((starts - line_offs) - t_offs)[t_idx].tolist()
+        hit_lines = _line_numbers(line_starts, rows[t_idx]).tolist()
+        for m, line_no, d in zip(hits, hit_lines, shift):
+            yield line_no, m.start() + d, m.end() + d, m.start(grp) + d, m.group(grp)
 
-            # ★ 1セル=生UKE行の想定を維持。将来分割されたら要調整
-            raw_line = rows[row_idx][0] if len(rows[row_idx]) == 1 else ",".join(rows[row_idx])
-            line_no = int(float(line_starts[disp_idx]))  # "N.0" → N
+    @staticmethod
+    def _branch_spans_for(code_hits, base, branch_mode, br_1d, br_2d) -> List[Tuple[int, int, int]]:
+        """検出済みコード (line_no, code_start, code) から枝番の塗り区間 (line_no, 開始桁, 終了桁) を求める"""
+        spans: List[Tuple[int, int, int]] = []
+        if not base or branch_mode not in (1, 2):
+            return spans
+        # モードはループ中に変わらないので、枝番の桁数・期待桁数・照合する集合を先に決める
+        width = branch_mode
+        want = base + width
+        suffixes = br_1d if width == 1 else br_2d
+        append = spans.append
+        for line_no, code_start, code in code_hits:
+            dash = code.find("-")
+            if dash < 0:
+                if len(code) == want and code[-width:] in suffixes:
+                    append((line_no, code_start + base, code_start + want))
+                continue
+            if len(code) - code.count("-") != want:
+                continue
+            if code[dash + 1:] in suffixes:
+                b_s = code_start + dash + 1
+                append((line_no, b_s, b_s + width))
+            elif code[-width:] in suffixes:
+                append((line_no, code_start + base, code_start + want))
+        return spans
 
-            # 行内の RE を全部拾う（ハイライト用 & 統計用）
-            re_iters = list(RE_FIELD.finditer(raw_line))
-            if not re_iters:
-                self.no_re_line_count += 1
+    @staticmethod
+    def _branch_hit_counts(code_hits, base, branch_mode, br_1d, br_2d) -> Tuple[int, int]:
+        """
+        検出済みコードのうち、登録済みの枝番が付いたものの件数 (1桁, 2桁)（ステータスの枝番ヒット数）
+        ハイフン付きはハイフン以降、無ければ末尾の枝番桁で照合する
+        """
+        if not base or branch_mode not in (1, 2):
+            return 0, 0
+        width = branch_mode
+        want = base + width
+        suffixes = br_1d if width == 1 else br_2d
+        hits = 0
+        for _, _, code in code_hits:
+            norm = code.replace("-", "")
+            if len(norm) != want:
                 continue
+            dash = code.find("-")
+            hy = code[dash + 1:] if dash >= 0 else ""
+            if (hy and hy in suffixes) or (not hy and norm[-width:] in suffixes):
+                hits += 1
+        return (hits, 0) if width == 1 else (0, hits)
 
-            self.re_line_count += 1
-            self.re_token_count += len(re_iters)
-
-            # ★ 各 RE の "RE" 文字部分だけ黄色で塗る
-            for m_re in re_iters:
-                inner = re.search(r'RE', raw_line[m_re.start():m_re.end()], re.IGNORECASE)
-                if inner:
-                    re_s = m_re.start() + inner.start()
-                    re_e = re_s + 2
-                    self.re_spans.append((f"{line_no}.{re_s}", f"{line_no}.{re_e}"))
-
-            # ★ 既存の患者コードスキャンは「先頭の RE 以降」を対象
-            search_from = re_iters[0].end()
-            for m in self.regex.finditer(raw_line, search_from):
-                code = m.group('code') if ('code' in m.re.groupindex) else m.group(1)
-                code_start = m.start('code') if ('code' in m.re.groupindex) else m.start(1)
-                norm = code.replace("-", "")
-
-                if detect_mode == 1 and "-" in code:
-                    p_start = f"{line_no}.{code_start}"
-                    p_end   = f"{line_no}.{code_start + code.find('-')}"
-                    self.prefix_spans.append((p_start, p_end))
-
-                # 枝番着色
-                if self.branch_mode == 1 and base and len(norm) == base + 1:
-                    if "-" in code and code.split("-",1)[1] in self.br_1d:
-                        b_s = f"{line_no}.{code_start + code.find('-') + 1}"
-                        b_e = f"{line_no}.{code_start + code.find('-') + 2}"
-                        self.branch_spans.append((b_s, b_e))
-                    elif code[-1:] in self.br_1d:
-                        b_s = f"{line_no}.{code_start + base}"
-                        b_e = f"{line_no}.{code_start + base + 1}"
-                        self.branch_spans.append((b_s, b_e))
-
-                elif self.branch_mode == 2 and base and len(norm) == base + 2:
-                    if "-" in code and code.split("-",1)[1] in self.br_2d:
-                        b_s = f"{line_no}.{code_start + code.find('-') + 1}"
-                        b_e = f"{line_no}.{code_start + code.find('-') + 3}"
-                        self.branch_spans.append((b_s, b_e))
-                    elif code[-2:] in self.br_2d:
-                        b_s = f"{line_no}.{code_start + base}"
-                        b_e = f"{line_no}.{code_start + base + 2}"
-                        self.branch_spans.append((b_s, b_e))
-
-                start = f"{line_no}.{m.start()}"
-                end   = f"{line_no}.{m.end()}"
-                self.matches.append((start, end, "hit"))
+    def refresh_branch_spans(self):
+        """再走査せず、現在の枝番設定で枝番区間と枝番ヒット数だけを作り直す"""
+        args = (self.code_hits, self.base_code_len, self.branch_mode, self.br_1d, self.br_2d)
+        self.branch_spans = self._branch_spans_for(*args)
+        self.branch_hits = self._branch_hit_counts(*args)
 
     # ---------------- 描画 ----------------
+    def clear(self):
+        """タグをすべて外す（予約中の分割付与も捨てる）"""
+        self._tags_drawn = True
+        self._clear_tags()
+
     def _clear_tags(self):
-        self.txt.tag_remove("hit", "1.0", "end")
-        self.txt.tag_remove("single", "1.0", "end")
-        self.txt.tag_remove("branch", "1.0", "end")
-        self.txt.tag_remove("prefix", "1.0", "end")
-        self.txt.tag_remove("re", "1.0", "end")
+        self._draw_gen += 1
+        if not self._tags_drawn:
+            return   # 前回消してから何も塗っていない
+        self._tags_drawn = False
+        for tag in ("hit", "single", "branch", "prefix", "re"):
+            self.txt.tag_remove(tag, "1.0", "end")
+
+    def _view_line(self, line_no: int) -> int | None:
+        """論理行番号を Text 上の行番号へ。窓の外なら None"""
+        ln = line_no - self.view_offset
+        if ln < 1 or (self.view_rows is not None and ln > self.view_rows):
+            return None
+        return ln
+
+    def _add_spans(self, tag: str, spans):
+        """(line, start, end, ...) の区間をまとめて 1 回の tag add で付与（Tcl 呼び出しを 1 回に）"""
+        # 窓内かつ clip 範囲内の行だけを二分探索で切り出し、その分だけ "行.桁" にする
+        off = self.view_offset
+        lo = off + 1
+        hi = off + self.view_rows if self.view_rows is not None else None
+        if self.clip is not None:
+            lo = max(lo, self.clip[0])
+            hi = self.clip[1] if hi is None else min(hi, self.clip[1])
+        i = bisect.bisect_left(spans, lo, key=_span_line)
+        j = len(spans) if hi is None else bisect.bisect_right(spans, hi, lo=i, key=_span_line)
+        flat: List[str] = []
+        for span in itertools.islice(spans, i, j):
+            v = str(span[0] - off) + "."
+            flat.append(v + str(span[1])); flat.append(v + str(span[2]))
+        if flat:
+            self._tag_add_batched(tag, flat, 0, self._draw_gen)
+
+    def _tag_add_batched(self, tag: str, flat: List[str], pos: int, gen: int):
+        """flat[pos:] を TAG_BATCH 区間ずつ付与。続きは after_idle に回し、途中で塗り直されたら捨てる"""
+        if gen != self._draw_gen:
+            return
+        end = pos + TAG_BATCH * 2
+        self.txt.tag_add(tag, *flat[pos:end])
+        self._tags_drawn = True
+        if end < len(flat):
+            self.txt.after_idle(self._tag_add_batched, tag, flat, end, gen)
 
+    # タグの付け外しは Text が disabled のままでも行えるので、state の切り替えはしない
     def draw_all(self):
         self.focus_idx = -1
-        self.txt.config(state="normal")
         self._clear_tags()
-        # コード全件
-        for s, e, tag in self.matches:
-            self.txt.tag_add(tag, s, e)
+        # コード全件（compute が作るのは hit だけなので、タグ別に分け直さずそのまま 1 回で付与）
+        self._add_spans("hit", self.matches)
         # 枝番
-        for s, e in self.branch_spans:
-            self.txt.tag_add("branch", s, e)
+        self._add_spans("branch", self.branch_spans)
         # 任意記号の前半
-        for s, e in self.prefix_spans:
-            self.txt.tag_add("prefix", s, e)
+        self._add_spans("prefix", self.prefix_spans)
         # ★ REタグ（最後でもOK。コードと位置が被らない想定）
-        for s, e in self.re_spans:
-            self.txt.tag_add("re", s, e)
-        self.txt.config(state="disabled")
+        self._add_spans("re", self.re_spans)
 
-    def draw_single(self, idx: int):
+    def draw_single(self, idx: int, reveal: bool = True):
+        """idx 番目のマッチだけを強調。reveal=False なら窓の移動・スクロールをせず塗り直すだけ"""
         if not self.matches:
             return
         self.focus_idx = idx % len(self.matches)
-        s, e, tag = self.matches[self.focus_idx]
+        line_no, s, e, tag = self.matches[self.focus_idx]
         focus_tag = "single" if tag == "hit" else "branch"
-        self.txt.config(state="normal")
+        if reveal and self.on_reveal is not None:
+            self.on_reveal(line_no)
+        v = self._view_line(line_no)
+        vs = f"{v}.{s}" if v is not None else None
         self._clear_tags()
-        self.txt.tag_add(focus_tag, s, e)
-        for b_s, b_e in self.branch_spans:
-            self.txt.tag_add("branch", b_s, b_e)
-        for ps, pe in self.prefix_spans:
-            self.txt.tag_add("prefix", ps, pe)
+        if vs is not None:
+            self.txt.tag_add(focus_tag, vs, f"{v}.{e}")
+            self._tags_drawn = True
+        self._add_spans("branch", self.branch_spans)
+        self._add_spans("prefix", self.prefix_spans)
         # ★ REタグも常に表示
-        for rs, re_ in self.re_spans:
-            self.txt.tag_add("re", rs, re_)
-        self.txt.see(s)
-        self.txt.config(state="disabled")
\ No newline at end of file
+        self._add_spans("re", self.re_spans)
+        if reveal and vs is not None:
+            self.txt.see(vs)
\ No newline at end of file
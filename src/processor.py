@@ -6,8 +6,11 @@ RE_TOKEN = re.compile(r'(?<![A-Z])RE(?![A-Z])')  # 単独の "RE" を検出（
 
 def row_has_re(row: Iterable[str]) -> bool:
     # 行全体から RE を探す。UIがハイライトしているのと同等の最低限の判定。
-    joined = " ".join(map(lambda x: x if isinstance(x, str) else str(x), row))
-    return bool(RE_TOKEN.search(joined))
+    # セル単位で探し、最初のヒットで打ち切る（" " 区切りで連結しても
+    # セルをまたいだ一致は起きないので結果は同じ）。
+    # 行は csv.reader / load_csv 由来で常に str のリストなので、セルごとの str() 変換はしない。
+    search = RE_TOKEN.search
+    return any(search(c) for c in row)
 
 def convert_patient_code_if_needed(row: list[str], code_col_index: int) -> tuple[list[str], bool, str | None]:
     """
@@ -23,8 +26,8 @@ def convert_patient_code_if_needed(row: list[str], code_col_index: int) -> tuple
     if "-" not in code:
         return new_row, False, "missing_branch"
 
-    head, tail = code.split("-", 1)
-    if not (head.isdigit() and tail.isdigit() and len(tail) == 2):
+    head, _, tail = code.partition("-")   # 区切りは 1 回だけなので list を作らない
+    if not (len(tail) == 2 and tail.isdigit() and head.isdigit()):
         return new_row, False, "digit_mismatch"
 
     # 例の変換処理（必要に応じて修正してください）
@@ -51,8 +54,9 @@ def process_rows_with_error_capture(
 
     out_rows.append(header)
 
+    convert = convert_patient_code_if_needed
     for r in data_rows:
-        new_r, converted, skip_reason = convert_patient_code_if_needed(r, code_col_index)
+        new_r, converted, skip_reason = convert(r, code_col_index)
         out_rows.append(new_r)
         if (not converted) and row_has_re(r):
             # 末尾にエラー理由の列を追加して書き出しやすく
@@ -0,0 +1,66 @@
+# tests/test_highlighter.py
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from highlighter import Highlighter  # noqa: E402
+
+
+class _Text:
+    """Highlighter の初期化に要るところだけの Text の代役（compute は Tk に触らない）"""
+    def tag_configure(self, *args, **kwargs):
+        pass
+
+
+ROWS = [
+    ["RE", "", "0000012345", "", ""],      # 1: RE とコード
+    ["RE", "", "", "", ""],                # 2: RE はあるがコード欄が空
+    ['"RE",,0000067890,,'],                # 3: 単一列扱いの行（RE が引用符付き）
+    ["SY", "a\nRE", "0000022222", "", ""], # 4: フィールド内の改行の後の RE はフィールドではない
+    ["RE", "x\ny", "0000011111", "", ""],  # 5: 改行を含むフィールドの後ろのコード
+    [""],                                  # 6: 空文字列だけの行（RE なしに数える）
+    [],                                    # 7: 列の無い空行（どちらにも数えない）
+    ["HO", "1"],                           # 8: RE なし
+]
+
+
+def _compute(display_indices, rows=ROWS):
+    hl = Highlighter(_Text())
+    hl.set_base_code_len(10)
+    hl.set_allowed_code_lengths([10])
+    pattern = hl._build_regex(n_digits=10, trailing_commas=2, detect_mode=0, custom_sym=",")
+    lines = [",".join(r) for r in ROWS]
+    return hl.compute(lines, display_indices, range(1, len(display_indices) + 1),
+                      regex=pattern, rows=rows)
+
+
+class ComputeTest(unittest.TestCase):
+    def test_counts(self):
+        res = _compute(range(len(ROWS)))
+        self.assertEqual(res["re_token_count"], 4)
+        self.assertEqual(res["re_line_count"], 4)
+        self.assertEqual(res["no_re_line_count"], 3)   # 4・6・8 行目
+
+    def test_without_rows_blank_lines_are_not_counted(self):
+        res = _compute(range(len(ROWS)), rows=None)
+        self.assertEqual(res["no_re_line_count"], 2)   # [""] も空行とみなす
+
+    def test_spans(self):
+        res = _compute(range(len(ROWS)))
+        self.assertEqual(res["re_spans"], [(1, 0, 2), (2, 0, 2), (3, 1, 3), (5, 0, 2)])
+        self.assertEqual(res["matches"], [(1, 3, 16, "hit"), (3, 5, 18, "hit"), (5, 6, 19, "hit")])
+        self.assertEqual(res["code_hits"],
+                         [(1, 4, "0000012345"), (3, 6, "0000067890"), (5, 7, "0000011111")])
+
+    def test_filtered_display_order(self):
+        # 表示順（絞り込み後）の行番号で返る
+        res = _compute([4, 5, 6, 0])
+        self.assertEqual(res["re_spans"], [(1, 0, 2), (4, 0, 2)])
+        self.assertEqual(res["code_hits"], [(1, 7, "0000011111"), (4, 4, "0000012345")])
+        self.assertEqual(res["no_re_line_count"], 1)   # [""] だけ（[] は数えない）
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+# tests/test_reconcile_keys.py
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from reconcile_patient_codes import INT_KEY_DIGITS, _key_numeric  # noqa: E402
+
+
+class KeyNumericTest(unittest.TestCase):
+    def test_leading_zeros_are_dropped(self):
+        self.assertEqual(_key_numeric("0000012345"), 12345)
+        self.assertEqual(_key_numeric(" 0000012345 "), 12345)
+        self.assertEqual(_key_numeric("000"), 0)   # 全 0 も空ではなく 0
+
+    def test_exactly_int_key_digits_is_int(self):
+        s = "1" * INT_KEY_DIGITS
+        self.assertEqual(_key_numeric(s), int(s))
+        # 先頭 0 を落としてから桁数を見る
+        self.assertEqual(_key_numeric("0" + s), int(s))
+
+    def test_longer_codes_stay_str(self):
+        s = "1" * (INT_KEY_DIGITS + 1)
+        self.assertEqual(_key_numeric(s), s)
+        # int() の桁数上限を超える長さでも ValueError にならない
+        long = "9" * 5000
+        self.assertEqual(_key_numeric(long), long)
+        # 同じ値どうしは同じキーになる（先頭 0 の有無を問わない）
+        self.assertEqual(_key_numeric("00" + s), _key_numeric(s))
+
+    def test_non_numeric_input(self):
+        self.assertIsNone(_key_numeric(""))
+        self.assertIsNone(_key_numeric("   "))
+        self.assertIsNone(_key_numeric("abc"))
+        self.assertEqual(_key_numeric("A-0012-34"), 1234)   # 数字以外は除く
+        # 全角数字は int に通すと半角と同一視されるので str のまま
+        self.assertEqual(_key_numeric("１２３"), "１２３")
+        self.assertNotEqual(_key_numeric("１２３"), _key_numeric("123"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+# tests/test_save_uke.py
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from editor import read_rows  # noqa: E402
+from gui import UKEEditorGUI  # noqa: E402
+
+# レコード種別ごとに列数が異なる UKE（csv.Sniffer が区切りを推定できず単一列扱いになる）
+UKE_LINES = [
+    "IR,1,13,1,1234567,,テスト病院,202501,00",
+    "RE,1,1127,50,0000012345,,,,1,1,,,,,,,,,,,,,,,,,,,,,,",
+    "HO,06132013,12345678,1,,,",
+    "KO,80136015,1234567,1,,",
+    "SY,8842961,20250101,1,,,,",
+    "SI,1,1,112007410,,1,1,,,,,,,,,,,,,",
+    "GO,1,99,202501",
+    "RE,2,1127,50,0000067890,,,,1,1,,,,,,,,,,,,,,,,,,,,,,",
+]
+
+
+class _Editor:
+    """保存まわりのメソッドだけを持つ、Tk を作らない代役"""
+    _cache_row_strings = UKEEditorGUI._cache_row_strings
+    _requote_unchanged_rows = UKEEditorGUI._requote_unchanged_rows
+    _uke_bytes = UKEEditorGUI._uke_bytes
+
+    def __init__(self, path: Path):
+        self.rows, self._delimiter = read_rows(path)
+        self._cache_row_strings()
+
+
+def _load(lines: list[str]) -> _Editor:
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "sample.UKE"
+        path.write_bytes(("\r\n".join(lines) + "\r\n").encode("cp932"))
+        return _Editor(path)
+
+
+class SaveUkeTest(unittest.TestCase):
+    def test_single_column_uke_is_written_unquoted(self):
+        ed = _load(UKE_LINES)
+        self.assertTrue(all(len(r) == 1 for r in ed.rows))
+        self.assertEqual(ed._requote_rows, [])
+        out_lines = ed._row_csv[:]
+        # 変換した行（1 行目の RE）と未変換の行が混じっても、どちらも引用符で囲まれない
+        out_lines[1] = out_lines[1].replace("0000012345", "0000099999")
+        data = ed._uke_bytes(out_lines).decode("cp932")
+        expected = UKE_LINES[:]
+        expected[1] = expected[1].replace("0000012345", "0000099999")
+        self.assertEqual(data, "\r\n".join(expected) + "\r\n")
+
+    def test_comma_csv_requotes_unchanged_rows(self):
+        lines = ["RE,1,0000012345,,", 'SY,"a,b",x,,', "SI,1,2,,"]
+        ed = _load(lines)
+        self.assertEqual(ed._delimiter, ",")
+        self.assertEqual(ed._requote_rows, [1])
+        data = ed._uke_bytes(ed._row_csv[:]).decode("cp932")
+        self.assertEqual(data, "\r\n".join(lines) + "\r\n")
+
+
+if __name__ == "__main__":
+    unittest.main()